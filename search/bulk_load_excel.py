@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+"""
+bulk_load_excel.py
+
+Loads every sheet of many Excel workbooks into Oracle table: DOCS
+
+- Inputs are files, directories (searched recursively for .xlsx/.xlsm) or globs.
+- Workbooks are parsed in a process pool (openpyxl parsing is CPU-bound).
+- Parsed sheets are handed on in sorted input order (file name, then sheet
+  order), so when the same id appears in several workbooks the LATER FILE
+  WINS, whatever order the parses finish in.
+- Rows are routed to Oracle writer threads by hash(id) % writers, each with
+  its own connection and bounded queue. One id is only ever written by one
+  connection, in input order, so concurrent MERGEs never race on a key.
+- A manifest (JSON lines) records every (file, sheet, mtime) that loaded
+  cleanly, plus a "complete" entry once every sheet of a (file, mtime) is in.
+  Reruns skip complete workbooks without opening them and resume partly
+  loaded ones; a workbook is reloaded only if it changed on disk. Runs with
+  --limit load partial sheets and never write to the manifest.
+- Exits non-zero if any workbook failed or any sheet was left unloaded.
+
+Row mapping and the MERGE statement are shared with load_excel_to_oracle.py.
+
+This script is designed to be run from:
+  ...\Oracle-elser_\search>
+
+Example:
+  python .\bulk_load_excel.py "..\drops\2024-06-01" "..\drops\*.xlsx" --workers 4 --writers 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+import pandas as pd
+
+import oracledb
+
+from load_excel_to_oracle import UPSERT_SQL, dataframe_to_docs, load_env, oracle_conn
+
+
+EXCEL_SUFFIXES = {".xlsx", ".xlsm"}
+
+
+# -----------------------------
+# Input discovery
+# -----------------------------
+def expand_inputs(inputs: list[str]) -> list[Path]:
+    """
+    Resolve files / directories / glob patterns into a sorted, de-duplicated list of workbooks.
+    """
+    found: set[Path] = set()
+    for raw in inputs:
+        p = Path(raw)
+        if p.is_dir():
+            candidates = [c for c in p.rglob("*") if c.is_file()]
+        elif p.is_file():
+            candidates = [p]
+        else:
+            candidates = [Path(m) for m in glob.glob(raw, recursive=True)]
+            if not candidates:
+                print(f"[WARN] No match for: {raw}")
+        for c in candidates:
+            # skip Excel lock files (~$book.xlsx)
+            if c.suffix.lower() in EXCEL_SUFFIXES and not c.name.startswith("~$"):
+                found.add(c.resolve())
+    return sorted(found)
+
+
+# -----------------------------
+# Manifest (resume support)
+# -----------------------------
+class Manifest:
+    """
+    Append-only JSON-lines log of loaded (file, sheet, mtime) entries, plus one
+    {"file", "mtime", "sheets", "complete": true} entry per fully loaded workbook.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.done: set[tuple[str, str, float]] = set()
+        self.complete: set[tuple[str, float]] = set()
+        self._expected: dict[tuple[str, float], list[str]] = {}
+        self._lock = threading.Lock()
+        if path.exists():
+            with path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        e = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a crash mid-write can leave a partial last line
+                        continue
+                    if e.get("complete"):
+                        self.complete.add((e["file"], float(e["mtime"])))
+                    else:
+                        self.done.add((e["file"], e["sheet"], float(e["mtime"])))
+
+    def clear(self) -> None:
+        self.done.clear()
+        self.complete.clear()
+
+    def is_complete(self, file: str, mtime: float) -> bool:
+        return (file, mtime) in self.complete
+
+    def sheets_done(self, file: str, mtime: float) -> list[str]:
+        return [s for (f, s, m) in self.done if f == file and m == mtime]
+
+    def expect(self, file: str, mtime: float, sheets: list[str]) -> None:
+        """
+        Register a workbook's full sheet list; its "complete" entry is written
+        once all of them are recorded (immediately, if they already are).
+        """
+        with self._lock:
+            self._expected[(file, mtime)] = list(sheets)
+            self._check_complete(file, mtime)
+
+    def record(self, file: str, sheet: str, mtime: float, rows: int) -> None:
+        entry = {
+            "file": file,
+            "sheet": sheet,
+            "mtime": mtime,
+            "rows": rows,
+            "loaded_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        }
+        with self._lock:
+            self._append(entry)
+            self.done.add((file, sheet, mtime))
+            self._check_complete(file, mtime)
+
+    def _check_complete(self, file: str, mtime: float) -> None:
+        sheets = self._expected.get((file, mtime))
+        if sheets is None or (file, mtime) in self.complete:
+            return
+        if all((file, s, mtime) in self.done for s in sheets):
+            self._append({
+                "file": file,
+                "mtime": mtime,
+                "sheets": sheets,
+                "complete": True,
+                "loaded_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            })
+            self.complete.add((file, mtime))
+
+    def _append(self, entry: dict) -> None:
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+# -----------------------------
+# Parsing (runs in worker processes)
+# -----------------------------
+def fallback_prefix(file: str, sheet: str) -> str:
+    """
+    Prefix for rows without an id column. A short hash of file|sheet keeps
+    "<prefix>_<row>" well under the 64-char id limit, so long file/sheet names
+    can never truncate away the row number and collapse rows into one id.
+    """
+    return hashlib.sha1(f"{file}|{sheet}".encode("utf-8")).hexdigest()[:16]
+
+
+def parse_workbook(file: str, mtime: float, skip_sheets: list[str], limit: int) -> dict:
+    """
+    Parse every sheet of one workbook except those in skip_sheets.
+    Returns {"sheet_names": [...all sheets...], "sheets": [{"file", "sheet", "mtime", "docs"}, ...]}
+    with sheets in workbook order.
+    """
+    out = []
+    with pd.ExcelFile(file, engine="openpyxl") as xl:
+        sheet_names = list(xl.sheet_names)
+        for sheet in sheet_names:
+            if sheet in skip_sheets:
+                continue
+            df = xl.parse(sheet)
+            if limit and limit > 0:
+                df = df.head(limit)
+            docs = dataframe_to_docs(df, fallback_prefix=fallback_prefix(file, sheet)) if not df.empty else []
+            out.append({"file": file, "sheet": sheet, "mtime": mtime, "docs": docs})
+    return {"sheet_names": sheet_names, "sheets": out}
+
+
+# -----------------------------
+# Oracle writers (threads)
+# -----------------------------
+class WriterStopped(RuntimeError):
+    pass
+
+
+class SheetTracker:
+    """
+    A sheet is split into one part per writer. Counts finished parts and
+    reports the sheet totals once the last part is done.
+    """
+
+    def __init__(self):
+        self._pending: dict[tuple[str, str, float], dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def start(self, key: tuple[str, str, float], parts: int) -> None:
+        with self._lock:
+            self._pending[key] = {"parts": parts, "ok": 0, "err": 0}
+
+    def part_done(self, key: tuple[str, str, float], ok: int, err: int) -> Optional[tuple[int, int]]:
+        with self._lock:
+            p = self._pending[key]
+            p["ok"] += ok
+            p["err"] += err
+            p["parts"] -= 1
+            if p["parts"] > 0:
+                return None
+            del self._pending[key]
+            return p["ok"], p["err"]
+
+    def outstanding(self) -> list[tuple[str, str, float]]:
+        with self._lock:
+            return list(self._pending)
+
+
+def route(docs: list[dict], n: int) -> list[list[dict]]:
+    """
+    Split docs into n parts by a stable hash of the id (crc32, not hash(),
+    so the routing is the same in every run).
+    """
+    parts: list[list[dict]] = [[] for _ in range(n)]
+    for d in docs:
+        parts[zlib.crc32(str(d["id"]).encode("utf-8")) % n].append(d)
+    return parts
+
+
+def upsert_batch(conn, docs: list[dict], batch_size: int) -> tuple[int, int]:
+    """
+    executemany() with batcherrors so one bad row doesn't fail the whole sheet.
+    Returns (inserted_or_updated_count, error_count).
+    """
+    cur = conn.cursor()
+    # body/content can exceed the VARCHAR bind limit
+    cur.setinputsizes(body=oracledb.DB_TYPE_CLOB, content=oracledb.DB_TYPE_CLOB)
+    ok = 0
+    err = 0
+    for start in range(0, len(docs), batch_size):
+        chunk = docs[start:start + batch_size]
+        cur.executemany(UPSERT_SQL, chunk, batcherrors=True)
+        errors = cur.getbatcherrors()
+        for e in errors:
+            print(f"[ERROR] id={chunk[e.offset].get('id')}: {e.message}")
+        err += len(errors)
+        ok += len(chunk) - len(errors)
+    conn.commit()
+    cur.close()
+    return ok, err
+
+
+def recover_conn(conn):
+    """
+    Roll back after a failed sheet. If the connection itself is gone, reconnect;
+    if that fails too, the exception ends this writer.
+    """
+    try:
+        conn.rollback()
+        return conn
+    except Exception:
+        pass
+    try:
+        conn.close()
+    except Exception:
+        pass
+    print("[WARN] Oracle connection lost; reconnecting writer")
+    return oracle_conn()
+
+
+def writer_loop(
+    conn,
+    q: "queue.Queue[Optional[dict]]",
+    tracker: SheetTracker,
+    manifest: Manifest,
+    record: bool,
+    batch_size: int,
+    totals: dict,
+    lock: threading.Lock,
+) -> None:
+    try:
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            label = f"{Path(item['file']).name} [{item['sheet']}]"
+            try:
+                docs = item["docs"]
+                ok, err = upsert_batch(conn, docs, batch_size) if docs else (0, 0)
+            except Exception as e:
+                print(f"[ERROR] {label}: {e}")
+                ok, err = 0, len(item["docs"])
+                conn = recover_conn(conn)
+
+            sheet_totals = tracker.part_done((item["file"], item["sheet"], item["mtime"]), ok, err)
+            if sheet_totals is None:
+                continue
+            ok, err = sheet_totals
+            # Only clean, complete sheets go in the manifest; anything else is retried next run.
+            if record and err == 0:
+                manifest.record(item["file"], item["sheet"], item["mtime"], ok)
+            with lock:
+                totals["ok"] += ok
+                totals["err"] += err
+                totals["sheets"] += 1
+            print(f"  loaded {label}: OK={ok} | ERR={err}")
+    except Exception as e:
+        print(f"[ERROR] Oracle writer stopped: {e}")
+        with lock:
+            totals["dead"] += 1
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def put_or_abort(q: "queue.Queue[Optional[dict]]", item: Optional[dict], writer: threading.Thread) -> None:
+    """
+    Blocking put() that gives up once the writer draining this queue has died,
+    instead of waiting forever (or queueing work nobody will read).
+    """
+    while True:
+        if not writer.is_alive():
+            raise WriterStopped("Oracle writer stopped; aborting bulk load")
+        try:
+            q.put(item, timeout=1)
+            return
+        except queue.Full:
+            pass
+
+
+# -----------------------------
+# Main
+# -----------------------------
+def main():
+    ap = argparse.ArgumentParser(description="Parallel multi-file / multi-sheet Excel -> Oracle DOCS loader.")
+    ap.add_argument("inputs", nargs="+", help="Excel files, directories or glob patterns (later files win on duplicate ids)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Parser processes (default: CPU count)")
+    ap.add_argument("--writers", type=int, default=2, help="Oracle writer threads / connections (default: 2)")
+    ap.add_argument("--queue-size", type=int, default=8, help="Max sheet parts waiting per writer (default: 8)")
+    ap.add_argument("--batch-size", type=int, default=500, help="Rows per executemany() call (default: 500)")
+    ap.add_argument("--limit", type=int, default=0, help="Optional limit rows per sheet (0=all; trial run, not recorded in manifest)")
+    ap.add_argument("--manifest", default=None, help="Manifest path (default: <project root>/bulk_load_manifest.jsonl)")
+    ap.add_argument("--force", action="store_true", help="Ignore the manifest and reload everything")
+    args = ap.parse_args()
+
+    env_path = load_env()
+    if env_path:
+        print(f"Loaded .env from: {env_path}")
+
+    manifest_path = Path(args.manifest).resolve() if args.manifest else Path(__file__).resolve().parents[1] / "bulk_load_manifest.jsonl"
+    manifest = Manifest(manifest_path)
+    if args.force:
+        manifest.clear()
+    print(
+        f"Manifest: {manifest_path} ({len(manifest.complete)} workbooks complete, "
+        f"{len(manifest.done)} sheets already loaded)"
+    )
+    record = not (args.limit and args.limit > 0)
+    if not record:
+        print("--limit set: partial sheets will not be recorded in the manifest")
+
+    files = expand_inputs(args.inputs)
+    print(f"Workbooks found: {len(files)}")
+    if not files:
+        print("Nothing to load. Exiting.")
+        return
+
+    n_writers = max(1, args.writers)
+    queues: list["queue.Queue[Optional[dict]]"] = [queue.Queue(maxsize=max(1, args.queue_size)) for _ in range(n_writers)]
+    tracker = SheetTracker()
+    totals = {"ok": 0, "err": 0, "sheets": 0, "dead": 0}
+    lock = threading.Lock()
+    # Connect up front so a bad DSN/password fails before any parsing starts.
+    conns = [oracle_conn() for _ in range(n_writers)]
+    writers = [
+        threading.Thread(
+            target=writer_loop,
+            args=(conn, q, tracker, manifest, record, args.batch_size, totals, lock),
+            daemon=True,
+        )
+        for conn, q in zip(conns, queues)
+    ]
+    for t in writers:
+        t.start()
+
+    def dispatch(sheet: dict) -> None:
+        # Every writer gets a (possibly empty) part, so the sheet completes only
+        # once all of them are through it.
+        tracker.start((sheet["file"], sheet["sheet"], sheet["mtime"]), n_writers)
+        for q, writer, part in zip(queues, writers, route(sheet["docs"], n_writers)):
+            put_or_abort(q, {**sheet, "docs": part}, writer)
+
+    pending_files = list(files)
+    skipped = 0
+    failed = 0
+    aborted = False
+    max_in_flight = max(1, args.workers) * 2
+
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        in_flight: dict[Any, tuple[int, str, float, int]] = {}
+        # Finished parses waiting for an earlier file, keyed by submit order.
+        ready: dict[int, tuple[str, float, int, Optional[dict]]] = {}
+        next_seq = 0
+        next_emit = 0
+
+        def submit_next() -> bool:
+            nonlocal failed, skipped, next_seq
+            while pending_files:
+                f = pending_files.pop(0)
+                try:
+                    mtime = f.stat().st_mtime
+                except OSError as e:
+                    # moved/deleted since discovery (normal for daily drops)
+                    failed += 1
+                    print(f"[ERROR] cannot stat {f.name}: {e}")
+                    continue
+                file = str(f)
+                if manifest.is_complete(file, mtime):
+                    skipped += 1
+                    print(f"[SKIP] {f.name}: already loaded")
+                    continue
+                done = manifest.sheets_done(file, mtime)
+                try:
+                    fut = pool.submit(parse_workbook, file, mtime, done, args.limit)
+                except Exception as e:
+                    # e.g. BrokenProcessPool after a worker crash
+                    failed += 1
+                    print(f"[ERROR] cannot submit {f.name}: {e}")
+                    continue
+                in_flight[fut] = (next_seq, file, mtime, len(done))
+                next_seq += 1
+                return True
+            return False
+
+        def emit_ready() -> None:
+            nonlocal next_emit, skipped
+            while next_emit in ready:
+                file, mtime, n_done, res = ready.pop(next_emit)
+                next_emit += 1
+                if res is None:
+                    continue
+                name = Path(file).name
+                sheets = res["sheets"]
+                if record:
+                    manifest.expect(file, mtime, res["sheet_names"])
+                if not sheets:
+                    skipped += 1
+                    print(f"[SKIP] {name}: all {n_done} sheets already loaded")
+                    continue
+                rows = sum(len(s["docs"]) for s in sheets)
+                print(f"Parsed {name}: {len(sheets)} sheets, {rows} rows (skipped {n_done} loaded sheets)")
+                # put() blocks when writers fall behind, which also stops new parse submissions
+                for s in sheets:
+                    dispatch(s)
+
+        try:
+            while len(in_flight) < max_in_flight and submit_next():
+                pass
+
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    seq, file, mtime, n_done = in_flight.pop(fut)
+                    try:
+                        res = fut.result()
+                    except Exception as e:
+                        failed += 1
+                        res = None
+                        print(f"[ERROR] parse failed: {Path(file).name}: {e}")
+                    ready[seq] = (file, mtime, n_done, res)
+                emit_ready()
+                # ready counts too, so one slow early file can't let parses pile up unbounded
+                while len(in_flight) + len(ready) < max_in_flight and submit_next():
+                    pass
+        except WriterStopped as e:
+            aborted = True
+            print(f"[ERROR] {e}")
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    for q, writer in zip(queues, writers):
+        try:
+            put_or_abort(q, None, writer)
+        except WriterStopped:
+            pass
+    for t in writers:
+        t.join()
+
+    lost = tracker.outstanding()
+    for file, sheet, _ in lost:
+        print(f"[ERROR] not loaded: {Path(file).name} [{sheet}]")
+
+    print(
+        f"Bulk load complete. Files={len(files)} | Skipped={skipped} | Failed={failed} | "
+        f"Sheets={totals['sheets']} | Lost={len(lost)} | OK={totals['ok']} | ERR={totals['err']}"
+    )
+    if aborted or failed or lost or totals["dead"]:
+        print(f"[ERROR] Bulk load incomplete ({totals['dead']} writers died); rerun to resume.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -127,10 +127,11 @@ def parse_datetime_safe(v) -> Optional[datetime]:
         return None
 
 
-def dataframe_to_docs(df: pd.DataFrame) -> list[dict]:
+def dataframe_to_docs(df: pd.DataFrame, fallback_prefix: str = "excel") -> list[dict]:
     """
     Convert dataframe rows to docs-compatible dicts.
     Tries common column names, but will still work with minimal columns.
+    Rows without an id column get "<fallback_prefix>_<row number>".
     """
     id_col = pick_first_existing_column(df, ["id", "case_id", "doc_id", "incident_id"])
     title_col = pick_first_existing_column(df, ["title", "subject", "summary"])
@@ -139,7 +140,7 @@ def dataframe_to_docs(df: pd.DataFrame) -> list[dict]:
 
     docs = []
     for i, row in df.iterrows():
-        doc_id = to_string_safe(row[id_col]) if id_col else f"excel_{i+1}"
+        doc_id = to_string_safe(row[id_col]) if id_col else f"{fallback_prefix}_{i+1}"
         title = to_string_safe(row[title_col]) if title_col else (to_string_safe(row[id_col]) if id_col else f"Row {i+1}")
         body = to_string_safe(row[body_col]) if body_col else ""
 
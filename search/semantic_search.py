@@ -2,7 +2,8 @@ import os
 import sys
 import json
 import argparse
-from typing import Any, Dict, List
+import threading
+from typing import Any, Dict, List, Optional, Union
 
 import requests
 from elasticsearch import Elasticsearch
@@ -23,6 +24,20 @@ ELSER_FIELD = os.getenv("ES_ELSER_FIELD", "ml.inference.body_expanded")
 # ---------- Ollama ----------
 OLLAMA_HOST  = os.getenv("OLLAMA_HOST", "http://localhost:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
+# How long Ollama keeps the model resident after a call (e.g. "30m", "24h", "-1" = forever;
+# bare numbers are seconds)
+OLLAMA_KEEP_ALIVE  = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", "512"))
+OLLAMA_NUM_CTX_MIN = int(os.getenv("OLLAMA_NUM_CTX_MIN", "2048"))
+OLLAMA_NUM_CTX_MAX = int(os.getenv("OLLAMA_NUM_CTX_MAX", "8192"))
+
+# Fixed prefix: identical on every call so Ollama can reuse its KV cache for it.
+# Anything variable (context, question) must come after this.
+SYSTEM_PROMPT = (
+    "You are a precise assistant. Use ONLY the provided CONTEXT to answer. "
+    "If the answer is not in the context, say you don't have enough information. "
+    "Return a concise answer. If multiple incidents apply, use bullet points."
+)
 
 ES = Elasticsearch(
     ES_URL,
@@ -93,31 +108,97 @@ def build_context(results: List[Dict[str, Any]], max_chars: int = 6000) -> str:
     ctx = "\n".join(parts).strip()
     return ctx[:max_chars]
 
-def ollama_answer(user_question: str, context: str) -> str:
+def keep_alive_value(v: str) -> Union[str, int]:
+    """
+    Ollama parses a string keep_alive as a Go duration ("30m", "24h"), which
+    rejects bare numbers like "-1" or "3600"; those must be sent as JSON numbers.
+    """
+    v = str(v).strip()
+    try:
+        return int(v)
+    except ValueError:
+        return v
+
+def build_user_prompt(user_question: str, context: str) -> str:
+    return (
+        f"CONTEXT:\n{context}\n\n"
+        f"QUESTION:\n{user_question}"
+    )
+
+def num_ctx_for(prompt_chars: int, num_predict: int = OLLAMA_NUM_PREDICT) -> int:
+    """
+    Size num_ctx to the assembled prompt (~4 chars/token) plus the answer budget.
+    Rounded up to a power of two: Ollama reloads the model whenever num_ctx
+    changes, so only a handful of distinct sizes should ever be sent.
+    """
+    needed = prompt_chars // 4 + num_predict + 64
+    if needed > OLLAMA_NUM_CTX_MAX:
+        # Ollama would silently cut the grounded context to fit.
+        print(
+            f"[WARN] Prompt needs ~{needed} tokens but OLLAMA_NUM_CTX_MAX={OLLAMA_NUM_CTX_MAX}; "
+            "context will be truncated. Lower --context-chars or raise OLLAMA_NUM_CTX_MAX."
+        )
+    ctx = OLLAMA_NUM_CTX_MIN
+    while ctx < needed and ctx < OLLAMA_NUM_CTX_MAX:
+        ctx *= 2
+    return min(ctx, OLLAMA_NUM_CTX_MAX)
+
+def num_ctx_for_budget(user_question: str, max_context_chars: int) -> int:
+    """
+    num_ctx for the largest prompt this question can produce (full context budget).
+    Computed once and sent on both the warm-up and the answer call, so the
+    answer never reloads the model the warm-up just loaded.
+    """
+    prompt = build_user_prompt(user_question, " " * max_context_chars)
+    return num_ctx_for(len(SYSTEM_PROMPT) + len(prompt))
+
+def ollama_warm(num_ctx: int, keep_alive: str = OLLAMA_KEEP_ALIVE) -> bool:
+    """
+    Loads the model with the given num_ctx and primes the KV cache with SYSTEM_PROMPT.
+    Returns True on success; failures are non-fatal.
+    """
+    url = f"{OLLAMA_HOST.rstrip('/')}/api/chat"
+    payload = {
+        "model": OLLAMA_MODEL,
+        "messages": [{"role": "system", "content": SYSTEM_PROMPT}],
+        "stream": False,
+        "keep_alive": keep_alive_value(keep_alive),
+        "options": {"num_ctx": num_ctx, "num_predict": 1},
+    }
+    try:
+        r = requests.post(url, json=payload, timeout=300)
+        r.raise_for_status()
+        return True
+    except requests.RequestException as e:
+        print(f"[WARN] Ollama warm-up failed: {e}")
+        return False
+
+def ollama_answer(
+    user_question: str,
+    context: str,
+    keep_alive: str = OLLAMA_KEEP_ALIVE,
+    num_ctx: Optional[int] = None,
+) -> str:
     """
     Calls Ollama /api/chat. Uses context-only instruction.
+    Prompt order is fixed system prefix -> context -> question, so the prefix
+    is served from Ollama's KV cache on repeat calls.
+    Pass the same num_ctx used for ollama_warm(); if omitted, it is sized
+    from the actual prompt.
     """
     url = f"{OLLAMA_HOST.rstrip('/')}/api/chat"
+    user_content = build_user_prompt(user_question, context)
+    if num_ctx is None:
+        num_ctx = num_ctx_for(len(SYSTEM_PROMPT) + len(user_content))
     payload = {
         "model": OLLAMA_MODEL,
         "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "You are a precise assistant. Use ONLY the provided CONTEXT to answer. "
-                    "If the answer is not in the context, say you don't have enough information."
-                )
-            },
-            {
-                "role": "user",
-                "content": (
-                    f"CONTEXT:\n{context}\n\n"
-                    f"QUESTION:\n{user_question}\n\n"
-                    "Return a concise answer. If multiple incidents apply, use bullet points."
-                )
-            }
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_content},
         ],
-        "stream": False
+        "stream": False,
+        "keep_alive": keep_alive_value(keep_alive),
+        "options": {"num_ctx": num_ctx, "num_predict": OLLAMA_NUM_PREDICT},
     }
 
     r = requests.post(url, json=payload, timeout=300)
@@ -148,8 +229,27 @@ def main() -> None:
         help="Also call Ollama to answer using the top hits as context"
     )
     parser.add_argument("--context-chars", type=int, default=6000, help="Max context length passed to LLM")
+    parser.add_argument(
+        "--keep-alive",
+        default=OLLAMA_KEEP_ALIVE,
+        help="How long Ollama keeps the model loaded after the call (e.g. 30m, 24h, -1 = forever, 3600 = seconds)"
+    )
+    parser.add_argument("--no-warm", action="store_true", help="Skip the Ollama model warm-up at startup")
     args = parser.parse_args()
 
+    # One num_ctx for warm-up and answer: a different value would reload the model.
+    num_ctx = num_ctx_for_budget(args.query, args.context_chars)
+
+    # Load the model while Elasticsearch is searching, instead of after.
+    warm_thread = None
+    if args.answer and not args.no_warm:
+        warm_thread = threading.Thread(
+            target=ollama_warm,
+            args=(num_ctx, args.keep_alive),
+            daemon=True,
+        )
+        warm_thread.start()
+
     print("ES VERSION:", es_info())
     print("INDEX:", INDEX)
     print("ELSER_MODEL:", MODEL)
@@ -157,6 +257,8 @@ def main() -> None:
     if args.answer:
         print("OLLAMA_HOST:", OLLAMA_HOST)
         print("OLLAMA_MODEL:", OLLAMA_MODEL)
+        print("OLLAMA_KEEP_ALIVE:", args.keep_alive)
+        print("OLLAMA_NUM_CTX:", num_ctx)
 
     results = semantic_search(args.query, size=args.size)
     print_hits(args.query, results)
@@ -166,8 +268,10 @@ def main() -> None:
         print("\n=========================")
         print("OLLAMA ANSWER (grounded)")
         print("=========================")
+        if warm_thread is not None:
+            warm_thread.join()
         try:
-            ans = ollama_answer(args.query, context)
+            ans = ollama_answer(args.query, context, keep_alive=args.keep_alive, num_ctx=num_ctx)
             print(ans)
         except requests.RequestException as e:
             print(f"ERROR calling Ollama: {e}")
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+snapshot_corpus.py
+
+Columnar (Parquet/Arrow) snapshot of the indexed corpus.
+
+Commands:
+  export   Scroll the Elasticsearch index and write a snapshot file holding
+           id, title, body, updated_at, content_hash and the ELSER
+           token-weight map for every document.
+  import   Bulk-load a snapshot into a (fresh) index. The stored ELSER tokens
+           are written as-is and the ingest pipeline is bypassed, so no ELSER
+           inference runs during the re-seed.
+  diff     Compare a snapshot with the live Oracle DOCS table and report
+           added / removed / changed ids (by content hash).
+
+The snapshot is read through a memory map, so diffs and re-seeds only touch
+the columns they need.
+
+This script is designed to be run from:
+  ...\Oracle-elser_\search>
+
+Examples:
+  python .\snapshot_corpus.py export --out ..\snapshots\corpus.parquet
+  python .\snapshot_corpus.py diff --snapshot ..\snapshots\corpus.parquet
+  python .\snapshot_corpus.py import --snapshot ..\snapshots\corpus.parquet --index oracle_elser_index_v3 --create
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from elasticsearch import Elasticsearch, helpers
+
+import oracledb
+
+from load_excel_to_oracle import load_env, oracle_conn
+
+
+SNAPSHOT_SCHEMA = pa.schema(
+    [
+        pa.field("id", pa.string(), nullable=False),
+        pa.field("title", pa.string()),
+        pa.field("body", pa.string()),
+        pa.field("updated_at", pa.timestamp("us", tz="UTC")),
+        pa.field("content_hash", pa.string(), nullable=False),
+        pa.field("tokens", pa.map_(pa.string(), pa.float32())),
+    ]
+)
+
+BATCH_ROWS = 5000
+
+# Where the ingest pipelines (elser_oracle_pipeline.json, check_stack.py) write the ELSER tokens.
+DEFAULT_ELSER_FIELD = "ml.tokens"
+
+
+# -----------------------------
+# Config (read after .env is loaded)
+# -----------------------------
+def es_client() -> Elasticsearch:
+    es_url = os.getenv("ES_URL", "http://localhost:9200")
+    es_user = os.getenv("ES_USER", "elastic")
+    es_pass = os.getenv("ES_PASS", os.getenv("ELASTIC_PASSWORD", "changeme"))
+    return Elasticsearch(es_url, basic_auth=(es_user, es_pass), request_timeout=120)
+
+
+def default_index() -> str:
+    return os.getenv("ES_INDEX", "oracle_elser_index_v2")
+
+
+# -----------------------------
+# Row helpers
+# -----------------------------
+def content_hash(title: Optional[str], body: Optional[str]) -> str:
+    """
+    Stable hash of the searchable text. Same "title\\nbody" shape that
+    Logstash builds for the `content` field; the title is stripped like
+    Logstash does, so Oracle and ES rows hash the same.
+    """
+    text = f"{(title or '').strip()}\n{body or ''}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_path(src: Dict[str, Any], dotted: str) -> Any:
+    cur: Any = src
+    for part in dotted.split("."):
+        if not isinstance(cur, dict):
+            return None
+        cur = cur.get(part)
+    return cur
+
+
+def set_path(dst: Dict[str, Any], dotted: str, value: Any) -> None:
+    parts = dotted.split(".")
+    cur = dst
+    for part in parts[:-1]:
+        cur = cur.setdefault(part, {})
+    cur[parts[-1]] = value
+
+
+def parse_es_date(v: Any) -> Optional[datetime]:
+    if not v:
+        return None
+    s = str(v).strip().replace("Z", "+00:00")
+    try:
+        dt = datetime.fromisoformat(s)
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+# -----------------------------
+# Export: ES -> snapshot
+# -----------------------------
+def iter_index_rows(es: Elasticsearch, index: str, field: str) -> Iterator[Dict[str, Any]]:
+    for h in helpers.scan(
+        es,
+        index=index,
+        query={"query": {"match_all": {}}, "_source": ["id", "title", "body", "updated_at", field]},
+        size=1000,
+        preserve_order=False,
+    ):
+        src = h.get("_source", {}) or {}
+        title = src.get("title") or ""
+        body = src.get("body")
+        if isinstance(body, list):
+            body = "\n".join(str(b) for b in body)
+        body = body or ""
+        tokens = get_path(src, field) or {}
+        yield {
+            "id": str(src.get("id") or h.get("_id")),
+            "title": title,
+            "body": body,
+            "updated_at": parse_es_date(src.get("updated_at")),
+            "content_hash": content_hash(title, body),
+            "tokens": list(tokens.items()),
+        }
+
+
+def export_snapshot(es: Elasticsearch, index: str, field: str, out_path: Path) -> int:
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(out_path.suffix + ".tmp")
+
+    total = 0
+    missing = 0
+    batch: List[Dict[str, Any]] = []
+    with pq.ParquetWriter(tmp_path, SNAPSHOT_SCHEMA, compression="zstd") as writer:
+        for row in iter_index_rows(es, index, field):
+            if not row["tokens"]:
+                missing += 1
+            batch.append(row)
+            if len(batch) >= BATCH_ROWS:
+                writer.write_table(pa.Table.from_pylist(batch, schema=SNAPSHOT_SCHEMA))
+                total += len(batch)
+                batch = []
+                print(f"  exported {total} docs...")
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=SNAPSHOT_SCHEMA))
+            total += len(batch)
+
+    if total and missing == total:
+        # Re-seeding from this would give an index nobody can search.
+        tmp_path.unlink()
+        raise ValueError(f"No ELSER tokens found at '{field}' in any of {total} docs (wrong --elser-field?)")
+    if missing:
+        print(f"[WARN] {missing} of {total} docs have no ELSER tokens at '{field}'")
+
+    # Replace atomically so a crashed export never leaves a half-written snapshot.
+    os.replace(tmp_path, out_path)
+    return total
+
+
+# -----------------------------
+# Import: snapshot -> ES (no inference)
+# -----------------------------
+def read_snapshot(path: Path, columns: Optional[List[str]] = None) -> pa.Table:
+    return pq.read_table(path, columns=columns, memory_map=True)
+
+
+def index_mapping(field: str) -> Dict[str, Any]:
+    props: Dict[str, Any] = {
+        "id": {"type": "keyword"},
+        "title": {"type": "text"},
+        "body": {"type": "text"},
+        "content": {"type": "text"},
+        "updated_at": {"type": "date"},
+    }
+    # Nest the rank_features field under its dotted path (e.g. ml.inference.body_expanded).
+    parts = field.split(".")
+    cur = props
+    for part in parts[:-1]:
+        cur = cur.setdefault(part, {"properties": {}})["properties"]
+    cur[parts[-1]] = {"type": "rank_features"}
+    return {"mappings": {"properties": props}}
+
+
+def iter_bulk_actions(path: Path, index: str, field: str) -> Iterator[Dict[str, Any]]:
+    pf = pq.ParquetFile(path, memory_map=True)
+    for rb in pf.iter_batches(batch_size=BATCH_ROWS):
+        for row in rb.to_pylist():
+            title = row["title"] or ""
+            body = row["body"] or ""
+            updated = row["updated_at"]
+            src: Dict[str, Any] = {
+                "id": row["id"],
+                "title": title,
+                "body": body,
+                "content": f"{title}\n{body}",
+                "updated_at": updated.isoformat() if updated else None,
+            }
+            set_path(src, field, dict(row["tokens"] or []))
+            yield {"_op_type": "index", "_index": index, "_id": row["id"], "_source": src}
+
+
+def field_types(es: Elasticsearch, index: str, field: str) -> Dict[str, Optional[str]]:
+    """
+    {concrete index: type of field}. The response is keyed by concrete index
+    names, so this also works when `index` is an alias.
+    """
+    res = es.indices.get_field_mapping(index=index, fields=field)
+    leaf = field.split(".")[-1]
+    out: Dict[str, Optional[str]] = {}
+    for name, body in dict(res).items():
+        mapping = ((body or {}).get("mappings", {}).get(field, {}) or {}).get("mapping", {})
+        out[name] = (mapping.get(leaf) or {}).get("type")
+    return out
+
+
+def import_snapshot(es: Elasticsearch, path: Path, index: str, field: str, create: bool) -> tuple[int, int]:
+    """
+    Returns (indexed_count, error_count).
+    """
+    if create:
+        if es.indices.exists(index=index):
+            raise ValueError(f"Index already exists: {index} (drop --create to load into it)")
+        es.indices.create(index=index, body=index_mapping(field))
+        print(f"Created index: {index}")
+    else:
+        # Bulk-indexing into a missing index would auto-create it with the tokens
+        # mapped as plain floats, and text_expansion queries would fail.
+        if not es.indices.exists(index=index):
+            raise ValueError(f"Index not found: {index} (use --create to create it with the right mapping)")
+        types = field_types(es, index, field)
+        bad = {name: t for name, t in types.items() if t != "rank_features"}
+        if not types or bad:
+            found = ", ".join(f"{name}={t or 'nothing'}" for name, t in (bad or types).items()) or "nothing"
+            raise ValueError(f"{index}: field '{field}' is mapped as {found}, expected rank_features")
+
+    ok = 0
+    err = 0
+    # pipeline="_none" bypasses any default ingest pipeline, so ELSER never runs.
+    for success, info in helpers.streaming_bulk(
+        es,
+        iter_bulk_actions(path, index, field),
+        chunk_size=1000,
+        pipeline="_none",
+        raise_on_error=False,
+    ):
+        if success:
+            ok += 1
+        else:
+            err += 1
+            print(f"[ERROR] {info}")
+        if (ok + err) % BATCH_ROWS == 0:
+            print(f"  loaded {ok + err} docs...")
+
+    es.indices.refresh(index=index)
+    return ok, err
+
+
+# -----------------------------
+# Diff: snapshot vs Oracle DOCS
+# -----------------------------
+def oracle_hashes(conn) -> Dict[str, str]:
+    cur = conn.cursor()
+    cur.arraysize = 1000
+    # Same filter as the Logstash JDBC input: rows without updated_at are never indexed.
+    cur.execute("SELECT id, title, body FROM docs WHERE updated_at IS NOT NULL")
+    out = {str(doc_id): content_hash(title, body) for doc_id, title, body in cur}
+    cur.close()
+    return out
+
+
+def diff_snapshot(path: Path, live: Dict[str, str]) -> Dict[str, List[str]]:
+    snap = read_snapshot(path, columns=["id", "content_hash"])
+    snap_hashes = dict(zip(snap.column("id").to_pylist(), snap.column("content_hash").to_pylist()))
+
+    added = sorted(k for k in live if k not in snap_hashes)
+    removed = sorted(k for k in snap_hashes if k not in live)
+    changed = sorted(k for k, h in live.items() if k in snap_hashes and snap_hashes[k] != h)
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def print_diff(diff: Dict[str, List[str]], show: int) -> None:
+    for kind in ("added", "removed", "changed"):
+        ids = diff[kind]
+        print(f"{kind.upper()}: {len(ids)}")
+        for doc_id in ids[:show]:
+            print(f"  - {doc_id}")
+        if len(ids) > show:
+            print(f"  ... ({len(ids) - show} more)")
+
+
+# -----------------------------
+# Main
+# -----------------------------
+def main():
+    ap = argparse.ArgumentParser(description="Parquet snapshot of the ELSER-indexed corpus.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    ex = sub.add_parser("export", help="Write the ES index to a snapshot file")
+    ex.add_argument("--out", required=True, help="Snapshot file to write (.parquet)")
+    ex.add_argument("--index", default=None, help="Source index (default: ES_INDEX)")
+    ex.add_argument("--elser-field", default=None, help=f"ELSER token field (default: ES_ELSER_FIELD or {DEFAULT_ELSER_FIELD})")
+
+    im = sub.add_parser("import", help="Bulk-load a snapshot into an index without ELSER inference")
+    im.add_argument("--snapshot", required=True, help="Snapshot file to read")
+    im.add_argument("--index", default=None, help="Target index (default: ES_INDEX)")
+    im.add_argument("--create", action="store_true", help="Create the target index with the rank_features mapping")
+    im.add_argument("--elser-field", default=None, help=f"ELSER token field (default: ES_ELSER_FIELD or {DEFAULT_ELSER_FIELD})")
+
+    dp = sub.add_parser("diff", help="Compare a snapshot with the live Oracle DOCS table")
+    dp.add_argument("--snapshot", required=True, help="Snapshot file to read")
+    dp.add_argument("--show", type=int, default=20, help="Max ids to print per category")
+
+    args = ap.parse_args()
+
+    env_path = load_env()
+    if env_path:
+        print(f"Loaded .env from: {env_path}")
+
+    if args.cmd == "export":
+        field = args.elser_field or os.getenv("ES_ELSER_FIELD", DEFAULT_ELSER_FIELD)
+        index = args.index or default_index()
+        out_path = Path(args.out).resolve()
+        print(f"Exporting index={index} (ELSER field={field}) -> {out_path}")
+        n = export_snapshot(es_client(), index, field, out_path)
+        print(f"Export complete. Docs={n} | Size={out_path.stat().st_size} bytes")
+
+    elif args.cmd == "import":
+        field = args.elser_field or os.getenv("ES_ELSER_FIELD", DEFAULT_ELSER_FIELD)
+        index = args.index or default_index()
+        snap_path = Path(args.snapshot).resolve()
+        if not snap_path.exists():
+            raise FileNotFoundError(f"Snapshot not found: {snap_path}")
+        print(f"Importing {snap_path} -> index={index} (ELSER field={field}, no inference)")
+        ok, err = import_snapshot(es_client(), snap_path, index, field, args.create)
+        print(f"Import complete. OK={ok} | ERR={err}")
+
+    elif args.cmd == "diff":
+        snap_path = Path(args.snapshot).resolve()
+        if not snap_path.exists():
+            raise FileNotFoundError(f"Snapshot not found: {snap_path}")
+        # Fetch CLOBs as plain strings so rows hash without per-LOB round trips.
+        oracledb.defaults.fetch_lobs = False
+        conn = oracle_conn()
+        live = oracle_hashes(conn)
+        conn.close()
+        print(f"Snapshot: {snap_path} | Oracle rows: {len(live)}")
+        print_diff(diff_snapshot(snap_path, live), args.show)
+
+
+if __name__ == "__main__":
+    main()